@@ -1,13 +1,13 @@
-from typing import Dict, List
+import asyncio
+from typing import AsyncIterator, Dict, List, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
-from langchain_core.chat_history import InMemoryChatMessageHistory as ChatMessageHistory
+from redis.asyncio import Redis
 from app.utils.citations import build_citations
-
-# In-memory conversation store by session_id (swap to Redis/DynamoDB for prod)
-_SESSION_STORE: Dict[str, ChatMessageHistory] = {}
+from app.utils.sessions import get_history, add_turn, last_user_message
 
 
 SYSTEM_PROMPT = (
@@ -56,14 +56,13 @@ PROMPT = ChatPromptTemplate.from_messages(
 )
 
 
-def get_history(session_id: str) -> ChatMessageHistory:
-    """Retrieve or create chat history for a session."""
-    if session_id not in _SESSION_STORE:
-        _SESSION_STORE[session_id] = ChatMessageHistory()
-    return _SESSION_STORE[session_id]
-
-
-def retrieve_context(vectordb: Chroma, question: str, k: int, filter_docs: List[str] = None) -> List:
+async def retrieve_context(
+    vectordb: Chroma,
+    question: str,
+    k: int,
+    filter_docs: List[str] = None,
+    extra_queries: List[str] = None,
+) -> List:
     """Retrieve relevant documents from vector store.
     
     Args:
@@ -71,32 +70,56 @@ def retrieve_context(vectordb: Chroma, question: str, k: int, filter_docs: List[
         question: User's question
         k: Number of chunks to retrieve
         filter_docs: Optional list of filenames to restrict search to
+        extra_queries: Optional additional queries searched in the same batch;
+                       results are merged by distance and deduplicated
     """
-    # Use direct similarity search with optional filtering
-    if filter_docs:
-        filter_dict = {"source": {"$in": filter_docs}}
-        return vectordb.similarity_search(question, k=k, filter=filter_dict)
-    else:
-        return vectordb.similarity_search(question, k=k)
+    filter_dict = {"source": {"$in": filter_docs}} if filter_docs else None
 
+    if not extra_queries:
+        # Use direct similarity search with optional filtering
+        return await vectordb.asimilarity_search(question, k=k, filter=filter_dict)
 
-def answer_question(
+    # Embed all queries concurrently, then search them with a single Chroma call
+    queries = [question, *extra_queries]
+    vectors = await asyncio.gather(*[vectordb.embeddings.aembed_query(q) for q in queries])
+    result = await asyncio.to_thread(
+        vectordb._collection.query,
+        query_embeddings=list(vectors),
+        n_results=k,
+        where=filter_dict,
+        include=["documents", "metadatas", "distances"],
+    )
+
+    # Union results across queries, keeping the closest match for each chunk
+    best = {}
+    for ids, texts, metadatas, distances in zip(
+        result["ids"], result["documents"], result["metadatas"], result["distances"]
+    ):
+        for doc_id, text, metadata, distance in zip(ids, texts, metadatas, distances):
+            if doc_id not in best or distance < best[doc_id][0]:
+                best[doc_id] = (distance, Document(page_content=text, metadata=metadata or {}))
+
+    ranked = sorted(best.values(), key=lambda item: item[0])
+    return [doc for _, doc in ranked[:k]]
+
+
+async def _build_prompt(
     *,
-    llm: ChatOpenAI,
     vectordb: Chroma,
+    history_lines: List[str],
     question: str,
-    session_id: str,
     k: int,
     filter_docs: List[str] = None,
-) -> Dict:
-    """
-    Main RAG pipeline: retrieve context, build prompt with history, query LLM, return answer with citations.
-    
-    Args:
-        filter_docs: Optional list of document filenames to restrict search to
-    """
-    # 1) Retrieve relevant docs (optionally filtered)
-    docs = retrieve_context(vectordb, question, k=k, filter_docs=filter_docs)
+    multi_query: bool = False,
+) -> Tuple[List, List]:
+    """Retrieve context and format the LLM prompt. Returns (docs, messages)."""
+    # 1) Retrieve relevant docs (optionally filtered), expanding follow-ups with the last user turn
+    extra_queries = None
+    if multi_query:
+        last_user_turn = last_user_message(history_lines)
+        if last_user_turn:
+            extra_queries = [f"{last_user_turn}\n{question}"]
+    docs = await retrieve_context(vectordb, question, k=k, filter_docs=filter_docs, extra_queries=extra_queries)
     
     # Format context with document names and page numbers for better referencing
     context_parts = []
@@ -108,19 +131,87 @@ def answer_question(
     context_text = "\n\n---\n\n".join(context_parts)
 
     # 2) Build prompt with recent history for coherence (last 3 turns = 6 messages)
-    history = get_history(session_id)
-    recent_messages = history.messages[-6:]
-    history_text = "\n".join(f"{msg.type.upper()}: {msg.content}" for msg in recent_messages)
+    history_text = "\n".join(history_lines)
 
-    # 3) LLM call
     msg = PROMPT.format_messages(context=context_text, question=question, history=history_text)
-    response = llm.invoke(msg)
+    return docs, msg
+
+
+async def answer_question(
+    *,
+    llm: ChatOpenAI,
+    vectordb: Chroma,
+    redis: Redis,
+    question: str,
+    session_id: str,
+    k: int,
+    session_ttl: int,
+    filter_docs: List[str] = None,
+    multi_query: bool = False,
+) -> Dict:
+    """
+    Main RAG pipeline: retrieve context, build prompt with history, query LLM, return answer with citations.
+    
+    Args:
+        filter_docs: Optional list of document filenames to restrict search to
+        session_ttl: Seconds of inactivity before a session's history expires
+        multi_query: Also search with the previous user turn for follow-up questions
+    """
+    history_lines = await get_history(redis, session_id)
+    docs, msg = await _build_prompt(
+        vectordb=vectordb,
+        history_lines=history_lines,
+        question=question,
+        k=k,
+        filter_docs=filter_docs,
+        multi_query=multi_query,
+    )
+
+    # 3) LLM call
+    response = await llm.ainvoke(msg)
 
     # 4) Update history
-    history.add_user_message(question)
-    history.add_ai_message(response.content)
+    await add_turn(redis, session_id, question, response.content, ttl=session_ttl)
 
     return {
         "answer": response.content,
         "citations": build_citations(docs),
     }
+
+
+async def astream_answer_question(
+    *,
+    llm: ChatOpenAI,
+    vectordb: Chroma,
+    redis: Redis,
+    question: str,
+    session_id: str,
+    k: int,
+    session_ttl: int,
+    filter_docs: List[str] = None,
+    multi_query: bool = False,
+) -> AsyncIterator[Dict]:
+    """
+    Streaming variant of answer_question.
+    
+    Yields {"delta": text} packets as the LLM generates, then a final {"citations": [...]}
+    packet. The full answer is saved to history once the stream completes.
+    """
+    history_lines = await get_history(redis, session_id)
+    docs, msg = await _build_prompt(
+        vectordb=vectordb,
+        history_lines=history_lines,
+        question=question,
+        k=k,
+        filter_docs=filter_docs,
+        multi_query=multi_query,
+    )
+
+    parts = []
+    async for chunk in llm.astream(msg):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield {"delta": chunk.content}
+
+    await add_turn(redis, session_id, question, "".join(parts), ttl=session_ttl)
+    yield {"citations": build_citations(docs)}
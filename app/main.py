@@ -1,19 +1,23 @@
 import os
+import asyncio
 import logging
+import orjson
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 import time
 import uuid
+import shutil
 import tempfile
 
 from app.settings import get_settings
 from app.utils.loaders import load_file, split_docs
 from app.utils.embeddings import get_embeddings, get_chroma, add_documents
-from app.chains import answer_question
+from app.utils.sessions import get_redis
+from app.chains import answer_question, astream_answer_question
 from langchain_openai import ChatOpenAI
 
 # Configure logging
@@ -28,7 +32,8 @@ app = FastAPI(
     description="🦆 Your friendly AI-powered document reading duck! Upload documents and chat with them.",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
 )
 
 # CORS - configure for production with specific origins
@@ -49,15 +54,30 @@ settings = get_settings()
 _embeddings = None
 _vectordb = None
 _llm = None
+_redis = None
+
+# Bounds embedding requests in flight across all uploads handled by this process
+_embed_semaphore = asyncio.Semaphore(settings.embed_concurrency)
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize resources on startup."""
-    global _embeddings, _vectordb, _llm
+    global _embeddings, _vectordb, _llm, _redis
     logger.info("Starting Duc application...")
     try:
+        logger.info(f"Connecting to Redis at {settings.redis_url}...")
+        _redis = get_redis(settings.redis_url)
+        await _redis.ping()
+        
         logger.info("Initializing OpenAI embeddings...")
-        _embeddings = get_embeddings(settings.openai_api_key, settings.openai_base_url)
+        _embeddings = get_embeddings(
+            settings.openai_api_key,
+            settings.openai_base_url,
+            cache=_redis,
+            cache_ttl=settings.embedding_cache_ttl,
+            model=settings.embedding_model,
+            dimensions=settings.embedding_dim,
+        )
         
         logger.info(f"Connecting to Chroma DB at {settings.chroma_path}...")
         _vectordb = get_chroma(
@@ -85,48 +105,85 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown."""
     logger.info("Shutting down Duc application...")
-    # Add cleanup logic if needed
+    if _redis is not None:
+        await _redis.aclose()
+
+
+# Health check results are reused for a few seconds to keep frequent probes cheap
+_HEALTH_CACHE_TTL = 5.0
+_health_cache = {"expires": 0.0, "status": None, "checks": None}
+
+
+def _run_health_checks() -> Tuple[str, dict]:
+    """Verify that every dependency has been initialized."""
+    status = "healthy"
+    checks = {}
+    dependencies = {
+        "embeddings": (_embeddings, "Embeddings not initialized"),
+        "vectordb": (_vectordb, "Vector database not initialized"),
+        "llm": (_llm, "LLM not initialized"),
+        "sessions": (_redis, "Session store not initialized"),
+    }
+    for name, (resource, error) in dependencies.items():
+        if resource is None:
+            checks[name] = f"error: {error}"
+            status = "unhealthy"
+        else:
+            checks[name] = "ok"
+    return status, checks
 
 
 @app.get("/health")
-def health():
+async def health():
     """Enhanced health check with dependency verification."""
+    now = time.time()
+    if now >= _health_cache["expires"]:
+        status, checks = _run_health_checks()
+        _health_cache.update(expires=now + _HEALTH_CACHE_TTL, status=status, checks=checks)
+    
     health_status = {
-        "status": "healthy",
-        "timestamp": time.time(),
+        "status": _health_cache["status"],
+        "timestamp": now,
         "version": "1.0.0",
-        "checks": {}
+        "checks": _health_cache["checks"],
     }
+    status_code = 200 if health_status["status"] == "healthy" else 503
+    return ORJSONResponse(content=health_status, status_code=status_code)
+
+
+async def _process_file(f: UploadFile, timestamp: int) -> Tuple[str, List]:
+    """Save an uploaded file to a temp path and load it into documents."""
+    logger.info(f"Processing file: {f.filename}")
     
-    # Check embeddings
-    try:
-        if _embeddings is None:
-            raise Exception("Embeddings not initialized")
-        health_status["checks"]["embeddings"] = "ok"
-    except Exception as e:
-        health_status["checks"]["embeddings"] = f"error: {str(e)}"
-        health_status["status"] = "unhealthy"
+    # Use temporary file for processing
+    file_suffix = Path(f.filename).suffix
+    unique_id = uuid.uuid4().hex[:8]
     
-    # Check vector database
-    try:
-        if _vectordb is None:
-            raise Exception("Vector database not initialized")
-        health_status["checks"]["vectordb"] = "ok"
-    except Exception as e:
-        health_status["checks"]["vectordb"] = f"error: {str(e)}"
-        health_status["status"] = "unhealthy"
+    # Create temp file with proper extension
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=file_suffix)
+    tmp_path = Path(tmp.name)
     
-    # Check LLM
     try:
-        if _llm is None:
-            raise Exception("LLM not initialized")
-        health_status["checks"]["llm"] = "ok"
-    except Exception as e:
-        health_status["checks"]["llm"] = f"error: {str(e)}"
-        health_status["status"] = "unhealthy"
-    
-    status_code = 200 if health_status["status"] == "healthy" else 503
-    return JSONResponse(content=health_status, status_code=status_code)
+        # Stream the upload to disk (never fully in memory)
+        with tmp:
+            await asyncio.to_thread(shutil.copyfileobj, f.file, tmp)
+        file_size = tmp_path.stat().st_size
+        
+        # Prepare metadata for citations (stored in ChromaDB)
+        file_metadata = {
+            "original_filename": f.filename,
+            "upload_id": f"{timestamp}_{unique_id}",
+            "upload_timestamp": timestamp,
+            "file_size": file_size,
+        }
+        
+        # Load file with metadata (blocking parsers run off the event loop)
+        docs = await asyncio.to_thread(load_file, tmp_path, file_metadata)
+        logger.info(f"Successfully processed {f.filename}: {len(docs)} documents")
+        return f.filename, docs
+    finally:
+        # Delete temporary file after processing
+        tmp_path.unlink(missing_ok=True)
 
 
 @app.post("/upload")
@@ -139,46 +196,22 @@ async def upload(files: List[UploadFile] = File(...)):
         raise HTTPException(status_code=400, detail="No files provided")
     
     logger.info(f"Received {len(files)} files for upload")
-    uploaded = []
-    all_docs = []
     timestamp = int(time.time())
     
     try:
-        for f in files:
-            logger.info(f"Processing file: {f.filename}")
-            
-            # Use temporary file for processing
-            file_suffix = Path(f.filename).suffix
-            unique_id = uuid.uuid4().hex[:8]
-            
-            # Create temp file with proper extension
-            file_content = await f.read()
-            file_size = len(file_content)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_suffix) as tmp:
-                tmp.write(file_content)
-                tmp_path = Path(tmp.name)
-            
-            try:
-                # Prepare metadata for citations (stored in ChromaDB)
-                file_metadata = {
-                    "original_filename": f.filename,
-                    "upload_id": f"{timestamp}_{unique_id}",
-                    "upload_timestamp": timestamp,
-                    "file_size": file_size,
-                }
-                
-                # Load file with metadata
-                docs = load_file(tmp_path, metadata=file_metadata)
-                all_docs.extend(docs)
-                uploaded.append(f.filename)
-                logger.info(f"Successfully processed {f.filename}: {len(docs)} documents")
-            finally:
-                # Delete temporary file after processing
-                tmp_path.unlink(missing_ok=True)
-
-        # Split and index
-        chunks = split_docs(all_docs, settings.chunk_size, settings.chunk_overlap)
-        add_documents(_vectordb, chunks)
+        # Read and parse all files concurrently; parsers run in worker threads
+        results = await asyncio.gather(*[_process_file(f, timestamp) for f in files])
+        uploaded = [filename for filename, _ in results]
+        all_docs = [doc for _, docs in results for doc in docs]
+
+        # Split (CPU-bound, kept off the event loop) and index
+        chunks = await asyncio.to_thread(split_docs, all_docs, settings.chunk_size, settings.chunk_overlap)
+        await add_documents(
+            _vectordb,
+            chunks,
+            semaphore=_embed_semaphore,
+            batch_size=settings.embed_batch_size,
+        )
         
         logger.info(f"Successfully indexed {len(uploaded)} files into {len(chunks)} chunks")
         return {"indexed_files": uploaded, "chunks": len(chunks)}
@@ -194,9 +227,9 @@ async def list_documents():
     Returns unique documents with metadata.
     """
     try:
-        # Get all documents from ChromaDB
+        # Get all chunk metadata from ChromaDB (skip documents and embeddings payload)
         collection = _vectordb._collection
-        result = collection.get()
+        result = collection.get(include=["metadatas"])
         
         # Extract unique documents from metadata
         documents = {}
@@ -231,20 +264,11 @@ async def delete_document(filename: str):
     Use the original filename from the /documents list.
     """
     try:
-        # Get all documents from ChromaDB
+        # Find IDs of chunks belonging to this document ("source" mirrors original_filename)
         collection = _vectordb._collection
-        result = collection.get()
-        
-        # Find IDs of chunks belonging to this document
-        ids_to_delete = []
-        chunks_deleted = 0
-        
-        if result and result['metadatas']:
-            for i, metadata in enumerate(result['metadatas']):
-                doc_filename = metadata.get('original_filename', metadata.get('source', ''))
-                if doc_filename == filename:
-                    ids_to_delete.append(result['ids'][i])
-                    chunks_deleted += 1
+        result = collection.get(where={"source": filename}, include=[])
+        ids_to_delete = result['ids'] if result else []
+        chunks_deleted = len(ids_to_delete)
         
         if not ids_to_delete:
             raise HTTPException(status_code=404, detail=f"Document '{filename}' not found")
@@ -271,12 +295,12 @@ async def delete_all_documents():
     Use with caution - this clears the entire database.
     """
     try:
-        collection = _vectordb._collection
-        result = collection.get()
+        total_chunks = _vectordb._collection.count()
         
-        if result and result['ids']:
-            total_chunks = len(result['ids'])
-            collection.delete(ids=result['ids'])
+        if total_chunks:
+            # Drop and recreate the collection in place rather than deleting chunk by chunk.
+            # Safe only because a single process owns the embedded Chroma store.
+            _vectordb.reset_collection()
             logger.info(f"Deleted all documents ({total_chunks} chunks)")
             return {
                 "message": "Successfully deleted all documents",
@@ -292,6 +316,15 @@ async def delete_all_documents():
         raise HTTPException(status_code=500, detail=f"Failed to delete all documents: {str(e)}")
 
 
+def _parse_document_filter(documents: str | None) -> List[str] | None:
+    """Turn a comma-separated filename list into a search filter."""
+    if not documents or not documents.strip():
+        return None
+    filter_docs = [doc.strip() for doc in documents.split(",") if doc.strip()]
+    logger.info(f"Filtering search to documents: {filter_docs}")
+    return filter_docs
+
+
 @app.post("/chat")
 async def chat(
     question: str = Form(...),
@@ -316,24 +349,67 @@ async def chat(
     logger.info(f"Chat request - Session: {session_id}, Question: {question[:100]}...")
     
     try:
-        top_k = k or settings.max_context_docs
-        
-        # Parse document filter if provided
-        filter_docs = None
-        if documents and documents.strip():
-            filter_docs = [doc.strip() for doc in documents.split(",") if doc.strip()]
-            logger.info(f"Filtering search to documents: {filter_docs}")
-        
-        result = answer_question(
+        result = await answer_question(
             llm=_llm,
             vectordb=_vectordb,
+            redis=_redis,
             question=question,
             session_id=session_id,
-            k=top_k,
-            filter_docs=filter_docs,
+            k=k or settings.max_context_docs,
+            session_ttl=settings.session_ttl,
+            filter_docs=_parse_document_filter(documents),
+            multi_query=settings.multi_query_retrieval,
         )
         logger.info(f"Chat response generated successfully for session {session_id}")
-        return JSONResponse(result)
+        return ORJSONResponse(result)
     except Exception as e:
         logger.error(f"Chat error - Session: {session_id}, Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+
+
+@app.post("/chat/stream")
+async def chat_stream(
+    question: str = Form(...),
+    session_id: str = Form("default"),
+    k: int = Form(None),
+    documents: str = Form(None),  # Comma-separated list of filenames to search
+):
+    """
+    Streaming version of /chat using Server-Sent Events.
+    Emits `data: {"delta": "..."}` events as the answer is generated, then a final
+    `data: {"citations": [...]}` event. Failures mid-stream arrive as `data: {"error": "..."}`.
+    """
+    if not question or not question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    
+    logger.info(f"Chat stream request - Session: {session_id}, Question: {question[:100]}...")
+    
+    async def event_stream():
+        try:
+            async for packet in astream_answer_question(
+                llm=_llm,
+                vectordb=_vectordb,
+                redis=_redis,
+                question=question,
+                session_id=session_id,
+                k=k or settings.max_context_docs,
+                session_ttl=settings.session_ttl,
+                filter_docs=_parse_document_filter(documents),
+                multi_query=settings.multi_query_retrieval,
+            ):
+                yield b"data: " + orjson.dumps(packet) + b"\n\n"
+            logger.info(f"Chat stream completed for session {session_id}")
+        except Exception as e:
+            logger.error(f"Chat stream error - Session: {session_id}, Error: {str(e)}")
+            yield b"data: " + orjson.dumps({"error": f"Chat failed: {str(e)}"}) + b"\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Keep GZipMiddleware and nginx from buffering the event stream
+            "Content-Encoding": "identity",
+            "X-Accel-Buffering": "no",
+        },
+    )
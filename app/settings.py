@@ -6,11 +6,19 @@ class Settings(BaseSettings):
     openai_api_key: str
     openai_model: str = "gpt-4o-mini"  # Faster and more cost-efficient model
     openai_base_url: str | None = None
+    embedding_model: str = "text-embedding-3-small"
+    embedding_dim: int = 512        # Shortened vectors; changing this requires re-indexing
     chroma_path: str = "./chroma_store"
     collection_name: str = "docs"
     chunk_size: int = 1500        # Increased from 1000 for more context per chunk
     chunk_overlap: int = 200        # Increased from 120 for better continuity
     max_context_docs: int = 6       # Increased from 4 to retrieve more relevant info
+    multi_query_retrieval: bool = False  # Opt-in: also search with the previous question on follow-ups
+    embed_batch_size: int = 100     # Chunks embedded and written to Chroma per request
+    embed_concurrency: int = 4      # Embedding requests in flight per worker process, across uploads
+    redis_url: str = "redis://localhost:6379/0"
+    session_ttl: int = 86400        # Expire idle chat histories after a day
+    embedding_cache_ttl: int = 2592000  # Expire cached chunk embeddings after 30 days
     host: str = "0.0.0.0"
     port: int = 8000
 
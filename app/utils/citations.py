@@ -1,17 +1,18 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from langchain_core.documents import Document
 
+SNIPPET_LENGTH = 240
+
 
 def build_citations(docs: List[Document]) -> List[Dict]:
     """Build citation metadata from retrieved documents.
     
     Deduplicates sources to avoid showing the same source multiple times.
     """
-    # Track unique sources to avoid duplicates
-    unique_sources = {}
+    # Track the longest chunk per unique source as (length, index into docs)
+    best: Dict[str, Tuple[int, int]] = {}
     
-    # First pass - collect all citations
-    for d in docs:
+    for i, d in enumerate(docs):
         meta = d.metadata or {}
         source = meta.get("source")
         
@@ -22,20 +23,24 @@ def build_citations(docs: List[Document]) -> List[Dict]:
         # Create a unique key for this source
         source_key = f"{source}:{meta.get('page', 'none')}"
         
-        # If we haven't seen this source yet, or this chunk has more content
-        if source_key not in unique_sources or len(d.page_content) > len(unique_sources[source_key]["content"]):
-            unique_sources[source_key] = {
-                "source": source,
-                "page": meta.get("page"),
-                "chunk_id": meta.get("chunk_id"),
-                "content": d.page_content,
-                "snippet": (d.page_content[:240] + "…") if len(d.page_content) > 240 else d.page_content,
-            }
+        # Keep this chunk if we haven't seen the source yet, or it has more content
+        length = len(d.page_content)
+        if source_key not in best or length > best[source_key][0]:
+            best[source_key] = (length, i)
     
-    # Convert to list and remove the temporary content field
+    # Build citations only for the winning chunks, in first-seen order
     citations = []
-    for citation in unique_sources.values():
-        del citation["content"]
-        citations.append(citation)
+    for length, i in best.values():
+        d = docs[i]
+        meta = d.metadata
+        snippet = d.page_content[:SNIPPET_LENGTH]
+        if length > SNIPPET_LENGTH:
+            snippet += "…"
+        citations.append({
+            "source": meta.get("source"),
+            "page": meta.get("page"),
+            "chunk_id": meta.get("chunk_id"),
+            "snippet": snippet,
+        })
     
     return citations
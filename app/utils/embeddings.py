@@ -1,22 +1,121 @@
+import asyncio
+import hashlib
+import logging
+import struct
+import uuid
 from pathlib import Path
 from typing import Iterable, List
 
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 
+logger = logging.getLogger(__name__)
 
-def get_embeddings(api_key: str, base_url: str = None) -> OpenAIEmbeddings:
-    """Initialize OpenAI embeddings (uses text-embedding-3-small by default)."""
-    kwargs = {"api_key": api_key}
+
+# Cached vectors are packed as float32, the precision Chroma indexes them at, so a
+# cache hit indexes exactly the same vector as a fresh embedding
+def _pack_vector(vector: List[float]) -> bytes:
+    return struct.pack(f"<{len(vector)}f", *vector)
+
+
+def _unpack_vector(raw: bytes) -> List[float]:
+    return list(struct.unpack(f"<{len(raw) // 4}f", raw))
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that caches document vectors in Redis by content hash.
+
+    Only cache misses are sent to the underlying model, so re-uploading the same
+    content costs no embedding calls. Entries expire after `ttl` seconds. The cache
+    uses the app's async Redis client, so only aembed_documents consults it; the
+    sync embed_documents goes straight to the underlying model. Query embeddings
+    are not cached.
+    """
+
+    def __init__(self, underlying: Embeddings, redis: Redis, namespace: str, ttl: int):
+        self.underlying = underlying
+        self.redis = redis
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def _key(self, text: str) -> str:
+        return f"emb:f32:{self.namespace}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        keys = [self._key(t) for t in texts]
+        # The cache is only an optimisation: Redis failures fall back to embedding
+        try:
+            cached = await self.redis.mget(keys)
+        except RedisError as e:
+            logger.warning(f"Embedding cache lookup failed, embedding all texts: {e}")
+            cached = [None] * len(texts)
+        vectors = [_unpack_vector(raw) if raw is not None else None for raw in cached]
+
+        misses = [i for i, v in enumerate(vectors) if v is None]
+        if misses:
+            fresh = await self.underlying.aembed_documents([texts[i] for i in misses])
+            for i, v in zip(misses, fresh):
+                vectors[i] = v
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for i, v in zip(misses, fresh):
+                        pipe.set(keys[i], _pack_vector(v), ex=self.ttl)
+                    await pipe.execute()
+            except RedisError as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.underlying.aembed_query(text)
+
+
+def get_embeddings(
+    api_key: str,
+    base_url: str = None,
+    cache: Redis = None,
+    cache_ttl: int = 2592000,
+    model: str = "text-embedding-3-small",
+    dimensions: int = None,
+) -> Embeddings:
+    """Initialize OpenAI embeddings, optionally shortened to `dimensions`.
+
+    When a Redis client is given as `cache`, document embeddings are cached there
+    for `cache_ttl` seconds.
+    """
+    kwargs = {"api_key": api_key, "model": model}
+    if dimensions:
+        # text-embedding-3-* models can return shortened vectors natively
+        kwargs["dimensions"] = dimensions
     if base_url:
         # OpenAIEmbeddings uses 'openai_api_base' parameter, not 'base_url'
         kwargs["openai_api_base"] = base_url
-    return OpenAIEmbeddings(**kwargs)
+    embeddings = OpenAIEmbeddings(**kwargs)
+    if cache is None:
+        return embeddings
+    # Namespace by model and size so vectors from different configurations never mix
+    namespace = f"{model}:{dimensions or 'default'}"
+    return CachedEmbeddings(embeddings, cache, namespace=namespace, ttl=cache_ttl)
+
 
+def get_chroma(persist_directory: str, collection_name: str, embeddings: Embeddings) -> Chroma:
+    """Initialize or load a persistent Chroma vector database.
 
-def get_chroma(persist_directory: str, collection_name: str, embeddings: OpenAIEmbeddings) -> Chroma:
-    """Initialize or load a persistent Chroma vector database."""
+    Chroma's HNSW index only holds float32 vectors; quantized (SQ8/FP16) indexes
+    would need a different vector store. Index size and distance cost are instead
+    kept down by the shortened embedding dimensions (EMBEDDING_DIM).
+    """
     Path(persist_directory).mkdir(parents=True, exist_ok=True)
     return Chroma(
         collection_name=collection_name,
@@ -25,9 +124,37 @@ def get_chroma(persist_directory: str, collection_name: str, embeddings: OpenAIE
     )
 
 
-def add_documents(
-    vectordb: Chroma, docs: Iterable[Document]
+async def add_documents(
+    vectordb: Chroma, docs: Iterable[Document], semaphore: asyncio.Semaphore, batch_size: int = 100
 ) -> List[str]:
-    """Add documents to the vector store (auto-persists in newer ChromaDB)."""
-    ids = vectordb.add_documents(list(docs))
+    """Add documents to the vector store in batches (auto-persists in newer ChromaDB).
+
+    Each batch is embedded with a single embedding request. The caller's semaphore
+    bounds how many requests are in flight; share one across uploads to stay within
+    provider rate limits. Vectors are written straight to the underlying collection,
+    so Chroma doesn't embed the texts again.
+    """
+    docs = list(docs)
+    batches = [docs[start:start + batch_size] for start in range(0, len(docs), batch_size)]
+
+    async def _embed_batch(batch: List[Document]) -> List[List[float]]:
+        async with semaphore:
+            return await vectordb.embeddings.aembed_documents([d.page_content for d in batch])
+
+    vectors = await asyncio.gather(*[_embed_batch(batch) for batch in batches])
+    return await asyncio.to_thread(_write_batches, vectordb, batches, vectors)
+
+
+def _write_batches(vectordb: Chroma, batches: List[List[Document]], vectors: List[List[List[float]]]) -> List[str]:
+    """Write pre-embedded batches to the collection, one add call per batch."""
+    ids = []
+    for batch, batch_vectors in zip(batches, vectors):
+        batch_ids = [str(uuid.uuid4()) for _ in batch]
+        vectordb._collection.add(
+            ids=batch_ids,
+            embeddings=batch_vectors,
+            metadatas=[d.metadata for d in batch],
+            documents=[d.page_content for d in batch],
+        )
+        ids.extend(batch_ids)
     return ids
@@ -1,8 +1,10 @@
+import threading
+from functools import lru_cache
 from pathlib import Path
 from typing import List
 
 from langchain_community.document_loaders import (
-    PyPDFLoader,
+    PyPDFium2Loader,
     Docx2txtLoader,
     TextLoader,
     UnstructuredHTMLLoader,
@@ -12,6 +14,10 @@ from langchain_community.document_loaders import (
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+# PDFium is not thread-safe, even across different documents, and uploads load
+# files from several worker threads at once
+_PDFIUM_LOCK = threading.Lock()
+
 
 def load_file(path: Path, metadata: dict = None) -> List[Document]:
     """Load a document from file based on its extension with optional metadata."""
@@ -25,8 +31,9 @@ def load_file(path: Path, metadata: dict = None) -> List[Document]:
     })
 
     if suffix == ".pdf":
-        loader = PyPDFLoader(str(path))
-        docs = loader.load()
+        loader = PyPDFium2Loader(str(path))  # PDFium is much faster than pypdf on large files
+        with _PDFIUM_LOCK:
+            docs = loader.load()
     elif suffix in {".docx", ".doc"}:  # docx2txt supports .docx best
         loader = Docx2txtLoader(str(path))
         docs = loader.load()
@@ -60,12 +67,17 @@ def load_file(path: Path, metadata: dict = None) -> List[Document]:
     return docs
 
 
-def split_docs(docs: List[Document], chunk_size: int, chunk_overlap: int) -> List[Document]:
-    """Split documents into smaller chunks for embedding."""
-    splitter = RecursiveCharacterTextSplitter(
+@lru_cache(maxsize=8)
+def _get_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    """Build a text splitter once per chunking configuration and reuse it."""
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         length_function=len,
         is_separator_regex=False,
     )
-    return splitter.split_documents(docs)
+
+
+def split_docs(docs: List[Document], chunk_size: int, chunk_overlap: int) -> List[Document]:
+    """Split documents into smaller chunks for embedding."""
+    return _get_splitter(chunk_size, chunk_overlap).split_documents(docs)
@@ -0,0 +1,47 @@
+from typing import List
+
+from redis.asyncio import Redis
+
+# Keep the last 3 turns (6 messages) per session
+MAX_HISTORY_MESSAGES = 6
+
+# Messages are stored pre-formatted as "<ROLE>: <content>" prompt lines
+USER_PREFIX = "HUMAN: "
+AI_PREFIX = "AI: "
+
+
+def get_redis(url: str) -> Redis:
+    """Initialize the async Redis client shared by chat history and the embedding cache.
+
+    Responses stay as bytes because the embedding cache stores packed vectors.
+    """
+    return Redis.from_url(url)
+
+
+def _history_key(session_id: str) -> str:
+    return f"chat:{session_id}:lines"
+
+
+async def get_history(redis: Redis, session_id: str) -> List[str]:
+    """Return recent messages for a session as formatted prompt lines, oldest first."""
+    # Newest messages sit at the head of the list
+    raw = await redis.lrange(_history_key(session_id), 0, MAX_HISTORY_MESSAGES - 1)
+    return [line.decode("utf-8") for line in reversed(raw)]
+
+
+def last_user_message(lines: List[str]) -> str | None:
+    """Return the content of the most recent user message, if any."""
+    for line in reversed(lines):
+        if line.startswith(USER_PREFIX):
+            return line[len(USER_PREFIX):]
+    return None
+
+
+async def add_turn(redis: Redis, session_id: str, question: str, answer: str, ttl: int) -> None:
+    """Append a question/answer turn and trim the session to the capped length."""
+    key = _history_key(session_id)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.lpush(key, USER_PREFIX + question, AI_PREFIX + answer)
+        pipe.ltrim(key, 0, MAX_HISTORY_MESSAGES - 1)
+        pipe.expire(key, ttl)
+        await pipe.execute()
@@ -0,0 +1,13 @@
+#!/bin/sh
+# Production entrypoint: uvicorn on the uvloop/httptools stack.
+# Defaults to a single worker: the embedded Chroma store is not process-safe, so
+# only raise WEB_CONCURRENCY once Chroma runs as a separate server.
+# Keep native parsers (PDF/DOCX/OCR) from spawning a thread pool per worker.
+export OMP_NUM_THREADS="${OMP_NUM_THREADS:-1}"
+
+exec uvicorn app.main:app \
+    --host "${HOST:-0.0.0.0}" \
+    --port "${PORT:-8000}" \
+    --workers "${WEB_CONCURRENCY:-1}" \
+    --loop uvloop \
+    --http httptools
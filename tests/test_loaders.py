@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pdfium = pytest.importorskip("pypdfium2")
+
+from app.utils.loaders import load_file
+
+
+def _make_pdf(path, pages):
+    pdf = pdfium.PdfDocument.new()
+    for _ in range(pages):
+        pdf.new_page(200, 200)
+    pdf.save(str(path))
+    pdf.close()
+
+
+def test_load_pdfs_from_concurrent_threads(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"doc{i}.pdf"
+        _make_pdf(path, pages=i + 1)
+        paths.append(path)
+
+    # Repeat so parses overlap; without the loader's lock pdfium can crash here
+    jobs = paths * 5
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        results = list(pool.map(lambda p: load_file(p, {"original_filename": p.name}), jobs))
+
+    for path, docs in zip(jobs, results):
+        assert len(docs) == int(path.stem[-1]) + 1
+        assert all(d.metadata["source"] == path.name for d in docs)